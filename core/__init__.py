@@ -2,74 +2,60 @@ from pathlib import Path
 import logging
 
 from core.config import Config
-from core.utils import Lock, info
+from core.utils import Lock, info, COLORS
 from core.gitignore import Gitignore
 #from core.sync import StatusList
 
-from cryptography.fernet import Fernet
-
-try:
-    import pretty_errors
-except ImportError:
-    pass
-
 class CustomFormatter(logging.Formatter):
     """Logging Formatter to add colors and count warning / errors"""
 
-    colors = {}
-    colors['black']    = '\033[0;30m'
-    colors['bblack']   = '\033[1;30m'
-    colors['red']      = '\033[0;31m'
-    colors['bred']     = '\033[1;31m'
-    colors['green']    = '\033[0;32m'
-    colors['bgreen']   = '\033[1;32m'
-    colors['yellow']   = '\033[0;33m'
-    colors['byellow']  = '\033[1;33m'
-    colors['blue']     = '\033[0;34m'
-    colors['bblue']    = '\033[1;34m'
-    colors['magenta']  = '\033[0;35m'
-    colors['bmagenta'] = '\033[1;35m'
-    colors['cyan']     = '\033[0;36m'
-    colors['bcyan']    = '\033[1;36m'
-    colors['white']    = '\033[0;37m'
-    colors['bwhite']   = '\033[1;37m'
-    colors['reset']    = '\033[0m'
-    colors['default']    = '\033[0m'
-
-    format = "%(message)s"
+    colors = COLORS
+
+    fmt = "%(message)s"
 
     FORMATS = {
-        logging.DEBUG: colors['default'] + format + colors['reset'],
-        logging.INFO: colors['default'] + format + colors['reset'],
-        logging.WARNING: colors['red'] + format + colors['reset'],
-        logging.ERROR: colors['bred'] + format + colors['reset'],
-        logging.CRITICAL: colors['bred'] + format + colors['reset']
+        logging.DEBUG: colors['default'] + fmt + colors['reset'],
+        logging.INFO: colors['default'] + fmt + colors['reset'],
+        logging.WARNING: colors['red'] + fmt + colors['reset'],
+        logging.ERROR: colors['bred'] + fmt + colors['reset'],
+        logging.CRITICAL: colors['bred'] + fmt + colors['reset']
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # create formatters once instead of for every record
+        self._formatters = {level: logging.Formatter(log_fmt) for level, log_fmt in self.FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        if (formatter := self._formatters.get(record.levelno)):
+            return formatter.format(record)
+        return super().format(record)
+
 
+# resolve homedir once, it doesn't change during a run
+HOME = Path.home()
 
 # init lockfile
 lock = Lock('/tmp/microdot.lock')
 
 # init logging
 logger = logging.getLogger("microdot")
-ch = logging.StreamHandler()
-ch.setFormatter(CustomFormatter())
-logger.addHandler(ch)
+# don't attach a second handler if module is loaded again, records would be printed twice
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    ch.setFormatter(CustomFormatter())
+    logger.addHandler(ch)
 logger.setLevel(logging.INFO)
 
 # init configfile and state
-state = Config(path=Path.home() / '.config/microdot/microdot.conf')
+state = Config(path=HOME / '.config/microdot/microdot.conf')
 state.core                   = {}
-state.core.dotfiles_dir      = str(Path.home() / '.dotfiles')
+state.core.dotfiles_dir      = str(HOME / '.dotfiles')
 state.core.channel_blacklist = ['.git']
 state.core.default_channel   = 'common'
 state.encryption             = {}
-state.encryption.key         = Fernet.generate_key()
+state.encryption.key         = None
+state.encryption.compression = ''     # compress encrypted dirs: '', 'gz', 'bz2' or 'xz'
 state.colors                 = {}
 state.colors.channel_name    = 'bblue'
 state.colors.linked          = 'green'
@@ -84,10 +70,14 @@ state.notifications          = {}
 state.notifications.error_interval = 60
 
 if not state.configfile_exists():
+    # cryptography is slow to import and only needed once to create a new key
+    from cryptography.fernet import Fernet
+    state.encryption.key = Fernet.generate_key()
     state.write(commented=False)
     info("init", "new_key", "New key created in config file, don't forget to backup!")
 
-state.load(merge=False)
+# merge so options missing from config files written by older versions keep their defaults
+state.load()
 
 # init program state
 state.channel       = None
@@ -121,12 +111,15 @@ ENCRYPTED_FILE_FORMAT = "{name}#{md5}#{ts}" + ENCRYPTED_FILE_EXT
 # format used in encrypted filenames
 TIMESTAMP_FORMAT = "%Y%m%d%H%M%S"
 
+# valid values for state.encryption.compression, these are tarfile's stream compressions
+TAR_COMPRESSIONS = ('', 'gz', 'bz2', 'xz')
+
 # dirname relative to dotfiles dir to store decrypted files/dirs in
 DECRYPTED_DIR = 'decrypted'
 
 # skip these dirs when searching for channels and dotfiles
-SCAN_DIR_BLACKLIST     = [DECRYPTED_DIR]
-SCAN_CHANNEL_BLACKLIST = [DECRYPTED_DIR]
+SCAN_DIR_BLACKLIST     = frozenset([DECRYPTED_DIR])
+SCAN_CHANNEL_BLACKLIST = frozenset([DECRYPTED_DIR])
 
 GIT_COMMIT_MSG = 'update'
 
@@ -1,4 +1,9 @@
 import logging
+import os
+import functools
+import threading
+import bisect
+import stat
 from pathlib import Path
 import shutil
 import hashlib
@@ -6,6 +11,8 @@ import base64
 import tarfile
 import tempfile
 from itertools import groupby
+from operator import attrgetter, methodcaller
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import re
 from dataclasses import dataclass
@@ -16,15 +23,22 @@ from core.exceptions import MDPathLocationError, MDPathExistsError, MDPermission
 from core import state
 from core import CONFLICT_EXT, ENCRYPTED_DIR_EXT, ENCRYPTED_FILE_EXT, ENCRYPTED_DIR_FORMAT, ENCRYPTED_FILE_FORMAT
 from core import CONFLICT_FILE_EXT, CONFLICT_DIR_EXT, TIMESTAMP_FORMAT, DECRYPTED_DIR, SCAN_CHANNEL_BLACKLIST, SCAN_DIR_BLACKLIST
-from core import SCAN_DIR_FILE
-from core.utils import confirm, colorize, debug, info, get_hash, get_tar
+from core import SCAN_DIR_FILE, HOME, TAR_COMPRESSIONS
+from core.utils import confirm, colorize, debug, info, get_hash, hash_cache, write_tar, move, is_subpath
 from core.tree import TreeNode
 
-from cryptography.fernet import Fernet
-import cryptography
-
 logger = logging.getLogger("microdot")
 
+# parse conflict filename: name#hash#timestamp#D|F#CRYPT#CONFLICT
+CONFLICT_RE = re.compile(r"([^#]+)#([^#]+)#([0-9]+)#([A-Z])#([A-Z]+)#([A-Z]+)$")
+
+
+def parse_timestamp(ts):
+    """ Parse timestamp in TIMESTAMP_FORMAT, strptime is slow and this runs for every encrypted dotfile """
+    if len(ts) != 14 or not (ts.isascii() and ts.isdigit()):
+        raise ValueError(f"Invalid timestamp: {ts}")
+    return datetime.datetime(int(ts[0:4]), int(ts[4:6]), int(ts[6:8]), int(ts[8:10]), int(ts[10:12]), int(ts[12:14]))
+
 
 @dataclass
 class Conflict():
@@ -35,13 +49,13 @@ class Conflict():
     def parse(self) -> str:
         """ Use regex to parse conflict file name, return colored string """
         try:
-            r = re.search(r"(.+)#(.+)#([0-9]+)#([A-Z])#([A-Z]+)#([A-Z]+)", self.name.name)
-        except re.error as e:
-            # TODO needs unittest
-            raise MDParseError(f"Failed to parse string, {e}")
+            r = CONFLICT_RE.match(self.name.name)
         except TypeError as e:
             raise MDParseError(f"Failed to parse string, {e}")
 
+        if not r:
+            raise MDParseError(f"Failed to parse string, {self.name.name}")
+
         n = []
         n.append(colorize(r.group(1), 'blue'))
         n.append(colorize(r.group(2), 'green'))
@@ -55,20 +69,18 @@ class Conflict():
 class DotBaseClass():
     """ Represents an unencrypted dotfile/dir.
         Is also the baseclass for DotEncryptedBaseClass """
-    def __init__(self, path, channel):
-        """ path is where dotfile source is: /home/eco/.dotfiles/common/testfile.txt """
+    def __init__(self, path, channel, entry=None):
+        """ path is where dotfile source is: /home/eco/.dotfiles/common/testfile.txt
+            entry is the os.DirEntry for path when found by a channel scan """
 
         self.channel = channel
         self.path = path
+        self._entry = entry
         self.name = path.relative_to(channel)
-        self.link_path = Path.home() / self.name
+        self.link_path = HOME / self.name
         self.is_encrypted = False
         self.cleanup_link()
 
-        if not self.path.parent.is_dir():
-            debug("__init__", 'mkdir', self.path.parent)
-            self.path.parent.mkdir(parents=True)
-
     def cleanup_link(self):
         # find orphan links (symlink that points 
         if self.link_path.is_symlink():
@@ -78,55 +90,77 @@ class DotBaseClass():
             #elif not self.link_path.resolve() == self.path:
             #    info("cleanup_link", "remove", f"link doesn't point to data: {self.link_path}")
             #    self.link_path.unlink()
-            elif not self.link_path.resolve().exists():
+            elif not self.link_path.exists():
+                # exists() follows the link, no need to resolve() and stat every component first
                 info("cleanup_link", "remove", f"link doesn't point to existing data: {self.link_path}")
                 self.link_path.unlink()
 
     def check_symlink(self):
         # check if link links to src
-        if not self.link_path.is_symlink():
+        # readlink is a single syscall, resolve() would stat every component of the path
+        try:
+            target = os.readlink(self.link_path)
+        except OSError:
+            # path doesn't exist or is not a symlink
             return
-        return self.link_path.resolve() == self.path.absolute()
+        return os.path.normpath(os.path.join(self.link_path.parent, target)) == os.path.abspath(self.path)
 
     def is_dir(self):
+        # DirEntry already knows the file type from the scan, no need to stat again
+        if self._entry:
+            return self._entry.is_dir()
         return self.path.is_dir()
 
     def is_file(self):
+        if self._entry:
+            return self._entry.is_file()
         return self.path.is_file()
 
-    def link(self, target=None, force=False):
+    def link(self, target=None, force=False, channels=None):
+        """ channels: list of channels to check for conflicts, all channels are scanned if None """
         if self.check_symlink():
             raise MDLinkError(f"Dotfile is already linked: {self.name}")
 
         link = self.link_path
 
         # NOTE: calls a function outside of class
-        if (df := search_conflicting_dotfiles(self.link_path.absolute())):
+        if (df := search_conflicting_dotfiles(self.link_path.absolute(), channels)):
             raise MDConflictError(f"Path conflicts with '{df.name}' in channel '{df.channel.name}'")
 
-        if not link.parent.is_dir():
-            link.parent.mkdir(parents=True)
-
         if not target:
             target = self.path
 
-        if link.is_symlink():
-            link.unlink()
-
-        if link.exists() and force:
-            self.remove_path(link)
-            info("link", "removed", "Path exists, using --force to overwrite: {link}")
-
-        if link.is_symlink():
-            raise MDLinkError(f"Dotfile already linked: {link}")
-
-        if link.exists():
-            raise MDLinkError(f"Path exists at link location: {link}")
+        # usually nothing is at the link location, so try to link first and only look
+        # at the location when that fails
+        try:
+            os.symlink(target, link)
+        except FileNotFoundError:
+            link.parent.mkdir(parents=True, exist_ok=True)
+            os.symlink(target, link)
+        except FileExistsError:
+            self.clear_link_location(link, force)
+            os.symlink(target, link)
 
-        link.symlink_to(target)
         debug("link", 'linked', f'{link} -> {target.name}')
         return True
     
+    def clear_link_location(self, link, force=False):
+        """ Remove stale link at link location, other paths are only removed when forced """
+        # lstat once and decide on the mode instead of stat'ing the same path for every check
+        mode = os.lstat(link).st_mode
+
+        if stat.S_ISLNK(mode):
+            # stale link, check_symlink() already ruled out a link to this dotfile
+            link.unlink()
+        elif force:
+            if stat.S_ISDIR(mode):
+                shutil.rmtree(link, ignore_errors=False, onerror=None)
+            else:
+                link.unlink()
+            info("link", "removed", f"Path exists, using --force to overwrite: {link}")
+        else:
+            raise MDLinkError(f"Path exists at link location: {link}")
+
     def unlink(self):
         if not self.check_symlink():
             raise MDLinkError(f"Dotfile is not linked: {self.name}")
@@ -137,7 +171,12 @@ class DotBaseClass():
 
     def init(self, src, link=True):
         """ Move source path to dotfile location """
-        shutil.move(src, self.path)
+        # parent dirs are only needed for new dotfiles, scanned dotfiles already have them
+        if not self.path.parent.is_dir():
+            debug("init", 'mkdir', self.path.parent)
+            self.path.parent.mkdir(parents=True)
+
+        move(src, self.path)
         debug("init", 'moved', f'{src} -> {self.path}')
 
         if link:
@@ -179,59 +218,72 @@ class DotBaseClass():
 class DotEncryptedBaseClass(DotBaseClass):
     """ Baseclass for all encrypted files/directories """
     def __init__(self, path, channel, key):
-        try: # parse CRYPT file: ~/.dotfiles/common/testdir#IzjOuV4h#20220121162145#D#CRYPT
-            name, self.hash, ts,  _, _ = path.name.split('#')
-            self.path = channel.parent / DECRYPTED_DIR / channel.name / path.relative_to(channel).parent / name
-            self.encrypted_path = path
-            self.name = self.path.relative_to(channel.parent / DECRYPTED_DIR / channel.name)
-            self.timestamp = datetime.datetime.strptime(ts, TIMESTAMP_FORMAT)
-            self.link_path = Path.home() / self.name
+        try:
+            relative_path = path.relative_to(channel)
         except ValueError:
-            try: # parse path that will be used by init to initiate new encrypted dotfile: ~/.dotfiles/common/testfile.txt
-                 # allow incomplete data. missing data will be added later
-                self.hash = None
-                self.path = channel.parent / DECRYPTED_DIR / channel.name / path.relative_to(channel)
-                self.name = path.relative_to(channel)
-                try:
-                    self.encrypted_path = self.get_encrypted_path(channel, self.name)
-                except FileNotFoundError:
-                    self.encrypted_path = None
-
-                self.timestamp = datetime.datetime.utcnow()
+            # TODO needs unittest
+            raise MDParseError(f"Failed to parse path: {path}")
+
+        # dispatch on the filename format instead of trying to parse and catching the error
+        # a CRYPT filename has 5 fields, bounding the split keeps longer names from being split further
+        parts = path.name.split('#', 5)
+        timestamp = None
+        if len(parts) == 5:
+            try:
+                timestamp = parse_timestamp(parts[2])
             except ValueError:
-                # TODO needs unittest
-                raise MDParseError(f"Failed to parse path: {path}")
+                pass
+
+        if timestamp: # parse CRYPT file: ~/.dotfiles/common/testdir#IzjOuV4h#20220121162145#D#CRYPT
+            name, self.hash, _,  _, _ = parts
+            self.name = relative_path.parent / name
+            self.path = channel.parent / DECRYPTED_DIR / channel.name / self.name
+            self.encrypted_path = path
+            self.timestamp = timestamp
+        else: # parse path that will be used by init to initiate new encrypted dotfile: ~/.dotfiles/common/testfile.txt
+              # allow incomplete data. missing data will be added later
+            self.hash = None
+            self.name = relative_path
+            self.path = channel.parent / DECRYPTED_DIR / channel.name / relative_path
+            try:
+                self.encrypted_path = self.get_encrypted_path(channel, self.name)
+            except FileNotFoundError:
+                self.encrypted_path = None
+
+            self.timestamp = datetime.datetime.utcnow()
 
         self.channel = channel
-        self.link_path = Path.home() / self.name
+        self.link_path = HOME / self.name
         self.is_encrypted = True
         self._key = key
 
         # cleanup orphan links (symlink that point to non existing data
         self.cleanup_link()
 
-        # ensure decrypted dir exists
-        if not self.path.parent.is_dir():
-            debug("__init__", 'mkdir', self.path.parent)
-            self.path.parent.mkdir(parents=True)
+    @property
+    def _fernet(self):
+        # cryptography is slow to import, only load it when we actually need to encrypt or decrypt
+        from core.crypt import get_fernet
+        return get_fernet(self._key)
 
-        # ensure encrypted dir exists
-        if self.encrypted_path and not self.encrypted_path.parent.is_dir():
-            debug("__init__", 'mkdir', self.encrypted_path.parent)
-            self.encrypted_path.parent.mkdir(parents=True)
+    def get_conflicts(self, paths=None):
+        """ Find conflicts that belong to this dotfile/dir
+            paths: conflict paths found while scanning the channel, if None the parent dir is scanned """
+        parent = self.encrypted_path.parent
+
+        if paths is None:
+            with os.scandir(parent) as it:
+                paths = [Path(e.path) for e in it if e.name.endswith(CONFLICT_EXT)]
 
-    def get_conflicts(self):
-        """ Find conflicts that belong to this dotfile/dir """
         conflicts = []
-        for p in self.encrypted_path.parent.iterdir():
-            if not p.name.endswith(CONFLICT_EXT):
+        for p in paths:
+            if p.parent != parent:
                 continue
-            try:
-                name, _, _,  _, _, _ = p.name.split('#')
-                if name == self.name.name:
-                    conflicts.append(Conflict(p, p.relative_to(self.channel)))
-            except ValueError:
-                pass
+
+            # conflict filename has 6 fields: name#hash#ts#D|F#CRYPT#CONFLICT
+            parts = p.name.split('#', 6)
+            if len(parts) == 6 and parts[0] == self.name.name:
+                conflicts.append(Conflict(p, p.relative_to(self.channel)))
         return conflicts
 
     def get_conflict(self, path):
@@ -249,11 +301,12 @@ class DotEncryptedBaseClass(DotBaseClass):
         if key == None:
             key = self._key
 
-        self.encrypted_path = self.get_encrypted_path(self.channel, self.name, src=src)
+        # check before anything is removed, tarfile would fail halfway with a CompressionError
+        compression = state.encryption.compression
+        if src.is_dir() and compression not in TAR_COMPRESSIONS:
+            raise MDEncryptionError(f"Invalid compression in config: '{compression}', choose from: {', '.join(TAR_COMPRESSIONS[1:])} or leave empty")
 
-        # if dir, compress dir into tmp tar file
-        if src.is_dir():
-            src = get_tar(src)
+        self.encrypted_path = self.get_encrypted_path(self.channel, self.name, src=src)
 
         if self.encrypted_path.exists():
             if force:
@@ -261,14 +314,22 @@ class DotEncryptedBaseClass(DotBaseClass):
             else:
                 raise MDPathExistsError(f"Encrypted file exists in channel: {self.encrypted_path}")
 
-        fernet = Fernet(key)
-        encrypted = fernet.encrypt(src.read_bytes())
+        # ensure encrypted dir exists, only needed when writing so it isn't checked on every scan
+        if not self.encrypted_path.parent.is_dir():
+            debug("encrypt", 'mkdir', self.encrypted_path.parent)
+            self.encrypted_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # encrypt in chunks so big files don't need to fit in memory
+        from core.crypt import get_fernet
+        fernet = get_fernet(key)
 
-        # cleanyp tmp file
         if src.is_dir():
-            src.unlink()
+            # tar is streamed straight into the encrypted file, no tmp file needed
+            with fernet.encrypt_to(self.encrypted_path) as writer:
+                write_tar(src, writer, compression)
+        else:
+            fernet.encrypt_file(src, self.encrypted_path)
 
-        self.encrypted_path.write_bytes(encrypted)
         debug("encrypt", 'encrypted', f'{src.name} -> {self.encrypted_path}')
 
     def decrypt(self, dest=None, src=None):
@@ -279,29 +340,36 @@ class DotEncryptedBaseClass(DotBaseClass):
         if src == None:
             src = self.encrypted_path
 
-        if dest.exists():
-            dest.unlink()
+        # decrypted dir is only created when something is decrypted into it, not on every scan
+        if not dest.parent.is_dir():
+            debug("decrypt", 'mkdir', dest.parent)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+
+        # decrypt_file() replaces dest only after the token is authenticated
+        from core.crypt import InvalidToken
 
         try:
-            fernet = Fernet(self._key)
-            decrypted = fernet.decrypt(src.read_bytes())
-        except cryptography.fernet.InvalidToken:
+            self._fernet.decrypt_file(src, dest)
+        except InvalidToken:
             # TODO needs unittest
             raise MDEncryptionError(f"Failed to decrypt {src}, invalid key.")
 
-        dest.write_bytes(decrypted)
         debug("decrypt", 'decrypted', f'{src.name} -> {dest}')
 
-    def link(self, force=False):
-        self.decrypt()
-        DotBaseClass.link(self, force=force)
+    def link(self, force=False, channels=None, decrypt=True):
+        """ decrypt=False: decrypted data is already in place, eg: decrypted in parallel by link_all() """
+        if decrypt:
+            self.decrypt()
+        DotBaseClass.link(self, force=force, channels=channels)
 
     def update(self):
         """ Update encrypted file if decrypted file/dir has changed from encrypted file """
         if not self.check_symlink():
             logger.error(f"Dotfile not linked {self.name}")
             return
-        if not self.is_changed():
+
+        # link is checked above, is_changed() would check it again
+        if self.hash == get_hash(self.path):
             return
         info("update", 'changed', self.path)
 
@@ -321,7 +389,7 @@ class DotEncryptedBaseClass(DotBaseClass):
     def get_encrypted_path(self, channel, name, src=None):
         """ If src is specified, calculate hash from this source instead of standard decrypted data location """
         if src == None:
-            md5 = get_hash(Path.home() / name)
+            md5 = get_hash(HOME / name)
         else:
             md5 = get_hash(src)
 
@@ -390,22 +458,42 @@ class DotDirEncrypted(DotEncryptedBaseClass):
         if dest == None:
             dest = self.path
 
-        tmp_dir = Path(tempfile.mkdtemp())
-        tmp_file = Path(tempfile.mktemp())
+        if src == None:
+            src = self.encrypted_path
+
+        from core.crypt import InvalidToken
+
+        if not dest.parent.is_dir():
+            debug("decrypt", 'mkdir', dest.parent)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+
+        # extract next to dest so it can be renamed into place instead of copied
+        tmp_dir = Path(tempfile.mkdtemp(prefix='.microdot_', dir=dest.parent))
 
-        DotEncryptedBaseClass.decrypt(self, src=src, dest=tmp_file)
+        try:
+            # decrypted data is streamed into tarfile, no tmp tar file needed
+            with open(src, 'rb') as f:
+                # detect compression so archives from any compression setting can be read
+                with tarfile.open(fileobj=self._fernet.reader(f), mode='r|*') as tar:
+                    tar.extractall(tmp_dir)
+
+            if dest.exists():
+                shutil.rmtree(dest, ignore_errors=False, onerror=None)
 
-        with tarfile.open(tmp_file, 'r') as tar:
-            tar.extractall(tmp_dir)
+            (tmp_dir / self.name.name).rename(dest)
+            debug("decrypt", "decrypted", f"{src.name} -> {dest}")
 
-        if dest.exists():
-            shutil.rmtree(dest, ignore_errors=False, onerror=None)
+        except InvalidToken:
+            raise MDEncryptionError(f"Failed to decrypt {src}, invalid key.")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-        # cant use pathlib's replace because files need to be on same filesystem
-        shutil.move((tmp_dir / self.name.name), dest)
-        debug("decrypt", "moved", f"{tmp_dir/self.name.name} -> {dest}")
 
-        tmp_file.unlink()
+# find class for encrypted dotfile by looking up the filename extension once instead of testing every extension
+# NOTE: both extensions have the same length
+ENCRYPTED_EXT_LEN = len(ENCRYPTED_DIR_EXT)
+ENCRYPTED_CLASSES = { ENCRYPTED_DIR_EXT  : DotDirEncrypted,
+                      ENCRYPTED_FILE_EXT : DotFileEncrypted }
 
 
 class Channel():
@@ -414,17 +502,34 @@ class Channel():
         self._key = state.encryption.key
         self._path = path
         self.name = path.name
-        self.dotfiles = self.search_dotfiles()
         self._colors = state.colors
 
+    @functools.cached_property
+    def dotfiles(self):
+        """ Channel is only scanned when dotfiles are needed, not on construction """
+        return self.search_dotfiles()
+
+    @functools.cached_property
+    def _by_name(self):
+        # index for fast lookups by name, reversed so the first dotfile in sorted order wins
+        return {str(df.name): df for df in reversed(self.dotfiles)}
+
+    @functools.cached_property
+    def _encrypted_by_name(self):
+        return {str(df.name): df for df in reversed(self.dotfiles) if df.is_encrypted}
+
+    @functools.cached_property
+    def _links(self):
+        # sorted (link path, index) pairs, lets is_conflict() find parents and children with a binary search
+        return sorted((os.fspath(df.link_path), i) for i, df in enumerate(self.dotfiles))
+
     def format_df(self, prefix, name, color):
         return prefix +  colorize(name, color)
 
     def add_tree_nodes(self, df, node: TreeNode):
         """ Create TreeNode structure, will be listed by list() """
-        # get or create all parent nodes
-        path = df.link_path.relative_to(Path.home())
-        for p in reversed(path.parents[:-1]):
+        # get or create all parent nodes, link_path is HOME / df.name so no need for relative_to()
+        for p in reversed(df.name.parents[:-1]):
             node = node.get_child(colorize(p.name, state.colors.tree_dirs))
 
         # add dotfile/dir node
@@ -434,16 +539,20 @@ class Channel():
         child = node.get_child(self.format_df(prefix, name, color))
 
         if df.is_encrypted:
-            for conflict in df.get_conflicts():
+            for conflict in df.get_conflicts(self._conflict_paths):
                 node.add_child(conflict.parse())
 
     def list(self, display=True):
         root = TreeNode(colorize(f"channel: {self.name}", state.colors.channel_name))
 
-        dotfiles  =  [d for d in self.dotfiles if d.is_dir() and not d.is_encrypted]
-        dotfiles += [f for f in self.dotfiles if f.is_file() and not f.is_encrypted]
-        dotfiles += [d for d in self.dotfiles if d.is_dir() and d.is_encrypted]
-        dotfiles += [f for f in self.dotfiles if f.is_file() and f.is_encrypted]
+        # sort dotfiles in one pass: dirs, files, encrypted dirs, encrypted files
+        dirs, files, encrypted_dirs, encrypted_files = [], [], [], []
+        for df in self.dotfiles:
+            if df.is_dir():
+                (encrypted_dirs if df.is_encrypted else dirs).append(df)
+            elif df.is_file():
+                (encrypted_files if df.is_encrypted else files).append(df)
+        dotfiles = dirs + files + encrypted_dirs + encrypted_files
 
         for df in dotfiles:
             self.add_tree_nodes(df, root)
@@ -458,13 +567,24 @@ class Channel():
 
     def link_all(self, force=False):
         """ Link all dotfiles in channel """
-        dotfiles = [df for df in self.dotfiles if not df.check_symlink()]
         if not (dotfiles := [df for df in self.dotfiles if not df.check_symlink()]):
             info("link_all", "link_all", "Nothing to link")
             return
 
+        # decrypting is the expensive part of linking and can be done in parallel.
+        # links are created one by one because every link is checked for conflicts with the others.
+        if (encrypted := [df for df in dotfiles if df.is_encrypted]):
+            with ThreadPoolExecutor() as executor:
+                list(executor.map(methodcaller('decrypt'), encrypted))
+
+        # scan channels once instead of once per link, linking doesn't change the dotfiles in channels
+        channels = get_channels(state)
+
         for dotfile in dotfiles:
-            dotfile.link(force=force)
+            if dotfile.is_encrypted:
+                dotfile.link(force=force, channels=channels, decrypt=False)
+            else:
+                dotfile.link(force=force, channels=channels)
             info("link_all", "linked", dotfile.name)
 
     def unlink_all(self):
@@ -481,39 +601,48 @@ class Channel():
         """ Start using a dotfile
             Copy dotfile to channel directory and create symlink. """
 
+        # abspath joins with cwd and normalizes in one go without building intermediate Path objects
+        abs_path = Path(os.path.abspath(path))
+
         try:
-            src = self._path / path.absolute().relative_to(Path.home())
+            src = self._path / abs_path.relative_to(HOME)
         except ValueError:
-            raise MDPathLocationError(f"Path is not in {Path.home()}: {path}")
+            raise MDPathLocationError(f"Path is not in {HOME}: {path}")
 
-        if self.is_child_of(path, [self._path.parent]):
+        if self.is_child_of(abs_path, [self._path.parent]):
             raise MDPathLocationError(f"Path should not be inside dotfiles dir: {path}")
 
-        if (df := search_conflicting_dotfiles(path.absolute())):
+        if (df := search_conflicting_dotfiles(abs_path)):
             raise MDConflictError(f"Path conflicts with '{df.name}' in channel '{df.channel.name}'")
 
-        if encrypted:
-            if path.is_file():
-                dotfile = DotFileEncrypted(src, self._path, self._key)
-            elif path.is_dir():
-                dotfile = DotDirEncrypted(src, self._path, self._key)
-            else:
-                raise MDPathNotFoundError(f"Path is not a file or directory: {path}")
+        # a single lstat tells us if path is a file, dir or symlink
+        try:
+            mode = os.lstat(abs_path).st_mode
+        except FileNotFoundError:
+            raise MDPathNotFoundError(f"Path is not a file or directory: {path}")
+
+        if stat.S_ISLNK(mode):
+            raise MDPathNotFoundError(f"Path is a symlink, not a file or directory: {path}")
+        elif stat.S_ISREG(mode):
+            dotfile = DotFileEncrypted(src, self._path, self._key) if encrypted else DotBaseClass(src, self._path)
+        elif stat.S_ISDIR(mode):
+            dotfile = DotDirEncrypted(src, self._path, self._key) if encrypted else DotBaseClass(src, self._path)
         else:
-            if path.is_file() or path.is_dir():
-                dotfile = DotBaseClass(src, self._path)
-            else:
-                raise MDPathNotFoundError(f"Path is not a file or directory: {path}")
+            raise MDPathNotFoundError(f"Path is not a file or directory: {path}")
 
         # raise error if dotfile already exists
         if self.dotfile_exists(dotfile.name):
             raise MDConflictError(f"Dotfile already managed: {dotfile.name}")
 
-        if not (path.is_file() or path.is_dir()):
-            raise MDPathNotFoundError(f"Source path is not a file or directory: {path}")
-
         dotfile.init(path, link=link)
 
+        self.dotfiles.append(dotfile)
+        self._by_name[str(dotfile.name)] = dotfile
+        if dotfile.is_encrypted:
+            self._encrypted_by_name[str(dotfile.name)] = dotfile
+
+        # rebuild link index on next use
+        self.__dict__.pop('_links', None)
         return dotfile
 
     def is_conflict(self, path: Path):
@@ -523,64 +652,79 @@ class Channel():
                 - path is in a parent path of another dotfile
                 - path is in a child path of another dotfile
         """
-        for df in self.dotfiles:
-            try:
-                df.link_path.relative_to(path)
-                if df.check_symlink():
-                    return df
-            except ValueError:
-                pass
-
-            try:
-                path.relative_to(df.link_path)
-                if df.check_symlink():
-                    return df
-            except ValueError:
-                pass
+        path = os.fspath(path)
+        links = self._links
+        matches = []
+
+        # dotfiles linked at path or at one of its parents
+        parent = path
+        while True:
+            i = bisect.bisect_left(links, (parent,))
+            while i < len(links) and links[i][0] == parent:
+                matches.append(links[i][1])
+                i += 1
+            if os.path.dirname(parent) == parent:
+                break
+            parent = os.path.dirname(parent)
+
+        # dotfiles linked inside path, sorted strings with the same prefix are next to each other
+        prefix = path.rstrip(os.sep) + os.sep
+        i = bisect.bisect_left(links, (prefix,))
+        while i < len(links) and links[i][0].startswith(prefix):
+            matches.append(links[i][1])
+            i += 1
+
+        # return first match in dotfiles order, like a linear search would
+        for i in sorted(set(matches)):
+            if self.dotfiles[i].check_symlink():
+                return self.dotfiles[i]
 
     def scan_dir(self, path):
-        """ Recursive find paths to dotfiles/dirs.
+        """ Find dotfiles/dirs, yields DirEntry objects.
             Dotdirs contain the SCAN_DIR_FILE
             Dotfiles are endpoints in channel dir that are not within a dotdir
         """
-        paths = []
+        stack = [path]
 
-        for p in path.iterdir():
-            if (p / SCAN_DIR_FILE).is_file():
-                paths.append(p)
-            elif p.is_dir():
-                paths += self.scan_dir(p)
-            else:
-                paths.append(p)
-        return paths
+        # walk iteratively, DirEntry caches the file type so we don't need to stat every path
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir() and not os.path.isfile(os.path.join(entry.path, SCAN_DIR_FILE)):
+                        stack.append(entry.path)
+                    else:
+                        yield entry
 
     def search_dotfiles(self) -> list:
-        """ Search channel for dotfile/dirs """
+        """ Search channel for dotfile/dirs
+            Conflicts found during the scan are kept so list() doesn't have to scan again """
         items = []
-        for path in self.scan_dir(self._path):
-            if path.name.endswith(CONFLICT_EXT):
-                continue
-            elif path.name.endswith(ENCRYPTED_DIR_EXT):
-                items.append(DotDirEncrypted(path, self._path, self._key))
-            elif path.name.endswith(ENCRYPTED_FILE_EXT):
-                items.append(DotFileEncrypted(path, self._path, self._key))
+        self._conflict_paths = []
+        # classify entries while scanning, DirEntry.name is a plain string so no Path is needed for that
+        for entry in self.scan_dir(self._path):
+            name = entry.name
+            path = Path(entry.path)
+            if name.endswith(CONFLICT_EXT):
+                self._conflict_paths.append(path)
+            elif (cls := ENCRYPTED_CLASSES.get(name[-ENCRYPTED_EXT_LEN:])):
+                items.append(cls(path, self._path, self._key))
             else:
-                items.append(DotBaseClass(path, self._path))
-        return sorted(items, key=lambda item: item.name)
+                items.append(DotBaseClass(path, self._path, entry))
+        return sorted(items, key=attrgetter('name'))
 
     def get_dotfile(self, name):
         """ Get dotfile object by filename """
-        for df in self.dotfiles:
-            if str(df.name) == str(name):
-                return df
-        raise MDDotNotFoundError(f"Dotfile not found: {name}")
+        try:
+            return self._by_name[str(name)]
+        except KeyError:
+            raise MDDotNotFoundError(f"Dotfile not found: {name}")
 
     def get_encrypted_dotfile(self, name):
         """ Get an encrypted dotfile object by filename """
-        for df in self.dotfiles:
-            if df.is_encrypted and str(df.name) == str(name):
-                return df
-        raise MDDotNotFoundError(f"Encrypted dotfile not found: {name}")
+        try:
+            return self._encrypted_by_name[str(name)]
+        except KeyError:
+            raise MDDotNotFoundError(f"Encrypted dotfile not found: {name}")
 
     def dotfile_exists(self, name: str) -> bool:
         try:
@@ -591,25 +735,41 @@ class Channel():
     def is_child_of(self, child: Path, parents: list) -> bool:
         """ Check if one of the paths is a parent of child path """
         for parent in parents:
-            try:
-                child.relative_to(parent)
+            if is_subpath(child, parent):
                 return parent
-            except ValueError:
-                pass
 
 
-def get_channels(state):
-    """ Find all channels in dotfiles dir and create Channel objects """
+def get_channels(state, prefetch=True):
+    """ Find all channels in dotfiles dir and create Channel objects
+        prefetch=False: don't scan for dotfiles, for callers that only need channel names """
     path      = state.core.dotfiles_dir
-    blacklist = state.core.channel_blacklist + SCAN_CHANNEL_BLACKLIST
-    return [ Channel(d, state) for d in Path(path).iterdir() if d.is_dir() and d.name not in blacklist ]
+    blacklist = SCAN_CHANNEL_BLACKLIST.union(state.core.channel_blacklist)
+    with os.scandir(path) as it:
+        dirs = [ Path(e.path) for e in it if e.name not in blacklist and e.is_dir() ]
+
+    # channels are independent so they can be scanned in parallel. only from the main thread,
+    # update() workers end up here through link() and shouldn't each start a pool of their own
+    channels = [ Channel(d, state) for d in dirs ]
+    if not prefetch or len(dirs) < 2 or threading.current_thread() is not threading.main_thread():
+        return channels
+
+    # call search_dotfiles() instead of going through the dotfiles property, on python < 3.12
+    # cached_property holds a class wide lock while computing so channels would be scanned one by one
+    with ThreadPoolExecutor(max_workers=min(8, len(dirs))) as executor:
+        for channel, dotfiles in zip(channels, executor.map(methodcaller('search_dotfiles'), channels)):
+            channel.__dict__['dotfiles'] = dotfiles
+    return channels
 
 def get_channel(name, state, create=False, assume_yes=False):
     """ Find or create and return Channel object """
     name         = name if name else "common"
-    dotfiles_dir = state.core.dotfiles_dir
+    dotfiles_dir = Path(state.core.dotfiles_dir)
     path         = dotfiles_dir / name
 
+    # a channel is a dir directly in dotfiles dir, '..' or 'a/b' would point somewhere else
+    if name in ('.', '..') or os.sep in name:
+        raise MDChannelNotFoundError(f"Invalid channel name: {name}")
+
     if not path.is_dir():
         if not create:
             raise MDChannelNotFoundError(f"Channel {name} not found")
@@ -622,9 +782,10 @@ def get_channel(name, state, create=False, assume_yes=False):
         except PermissionError as e:
             raise MDPermissionError("Insufficient permissions to create channel: {name}")
 
-    for channel in get_channels(state):
-        if channel.name == name:
-            return channel
+    # only create the requested channel instead of scanning all channels
+    blacklist = SCAN_CHANNEL_BLACKLIST.union(state.core.channel_blacklist)
+    if path.parent == dotfiles_dir and name not in blacklist:
+        return Channel(path, state)
 
 # TODO below should be part of channel class??
 def get_encrypted_dotfiles(linked=False, grouped=False):
@@ -633,7 +794,7 @@ def get_encrypted_dotfiles(linked=False, grouped=False):
         linked=True:  only return dotfiles that are linked """
 
     items = []
-    keyfunc = lambda x: x.name
+    keyfunc = attrgetter('name')
 
     for channel in get_channels(state):
         data = [x for x in channel.dotfiles if x.is_encrypted]
@@ -651,15 +812,20 @@ def get_encrypted_dotfiles(linked=False, grouped=False):
     return items
 
 def update_encrypted_from_decrypted():
-    for df in get_encrypted_dotfiles(linked=True):
-        df.update()
+    # every dotfile has its own encrypted file so they can be hashed and encrypted in parallel
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(methodcaller('update'), get_encrypted_dotfiles(linked=True)))
+    hash_cache.flush()
 
-def search_conflicting_dotfiles(path: Path):
+def search_conflicting_dotfiles(path: Path, channels=None):
     """ Search other channels for conflicted paths.
         WARNING: uses a function not in this class.
                  Need to fix this later 
     """
-    for channel in get_channels(state):
+    if channels is None:
+        channels = get_channels(state)
+
+    for channel in channels:
         if (df := channel.is_conflict(path)):
             return df
 
@@ -0,0 +1,290 @@
+import os
+import time
+import struct
+import base64
+import binascii
+import functools
+import tempfile
+import contextlib
+
+from cryptography.fernet import InvalidToken
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, padding
+from cryptography.hazmat.primitives.hmac import HMAC
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# Streaming implementation of the fernet spec: https://github.com/fernet/spec/blob/master/Spec.md
+# Tokens are compatible with cryptography.fernet.Fernet but data is never fully loaded in memory.
+
+# must be a multiple of 3 and 4 so base64 chunks can be concatenated
+CHUNK_SIZE = 64 * 1024 * 3
+
+FERNET_VERSION = b'\x80'
+IV_SIZE        = 16
+HEADER_SIZE    = len(FERNET_VERSION) + 8 + IV_SIZE
+HMAC_SIZE      = 32
+BLOCK_SIZE     = algorithms.AES.block_size // 8
+
+
+def split_key(key):
+    """ Decode base64 fernet key into signing and encryption key """
+    try:
+        key = base64.urlsafe_b64decode(key)
+    except binascii.Error as e:
+        raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.") from e
+
+    if len(key) != 32:
+        raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+    return key[:16], key[16:]
+
+
+class Base64Writer():
+    """ Base64 encode data in chunks and write to file object """
+    def __init__(self, fp):
+        self._fp = fp
+        self._buf = b''
+
+    def write(self, data):
+        # only encode multiples of 3 bytes so no padding ends up in the middle of the output
+        data = self._buf + data
+        n = len(data) - len(data) % 3
+        self._fp.write(base64.urlsafe_b64encode(data[:n]))
+        self._buf = data[n:]
+
+    def close(self):
+        self._fp.write(base64.urlsafe_b64encode(self._buf))
+        self._buf = b''
+
+
+class EncryptWriter():
+    """ File like object, encrypts everything that is written to it into a fernet token.
+        Token is complete after close() is called """
+    def __init__(self, signing_key, encryption_key, fp):
+        iv = os.urandom(IV_SIZE)
+
+        self._out = Base64Writer(fp)
+        self._hmac = HMAC(signing_key, hashes.SHA256())
+        self._encryptor = Cipher(algorithms.AES(encryption_key), modes.CBC(iv)).encryptor()
+        self._padder = padding.PKCS7(algorithms.AES.block_size).padder()
+
+        self._write_signed(FERNET_VERSION + struct.pack('>Q', int(time.time())) + iv)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+
+    def _write_signed(self, data):
+        self._hmac.update(data)
+        self._out.write(data)
+
+    def write(self, data):
+        self._write_signed(self._encryptor.update(self._padder.update(data)))
+        return len(data)
+
+    def close(self):
+        self._write_signed(self._encryptor.update(self._padder.finalize()) + self._encryptor.finalize())
+        self._out.write(self._hmac.finalize())
+        self._out.close()
+
+
+class Token():
+    """ Read a fernet token from a seekable file object in decoded chunks """
+    def __init__(self, fp):
+        self._fp = fp
+        self.signature = b''
+
+    def decode(self):
+        """ Yield decoded chunks of token """
+        for chunk in iter(lambda: self._fp.read(CHUNK_SIZE), b''):
+            try:
+                yield base64.urlsafe_b64decode(chunk)
+            except binascii.Error as e:
+                raise InvalidToken from e
+
+    def __iter__(self):
+        """ Yield decoded data up to the signature, signature is stored in self.signature """
+        self._fp.seek(0)
+        tail = b''
+        for data in self.decode():
+            data = tail + data
+            yield data[:-HMAC_SIZE]
+            tail = data[-HMAC_SIZE:]
+        self.signature = tail
+
+    def check(self, h, header, size):
+        """ Check format and signature of token after all data is read and fed to hmac h """
+        ciphertext_size = size - HEADER_SIZE
+        if len(self.signature) != HMAC_SIZE or ciphertext_size <= 0 or ciphertext_size % BLOCK_SIZE:
+            raise InvalidToken
+        if header[:1] != FERNET_VERSION:
+            raise InvalidToken
+
+        try:
+            h.verify(self.signature)
+        except InvalidSignature:
+            raise InvalidToken
+
+    def verify(self, signing_key):
+        """ Check format and signature of token, return iv """
+        h = HMAC(signing_key, hashes.SHA256())
+        header = b''
+        size = 0
+
+        for data in self:
+            if len(header) < HEADER_SIZE:
+                header += data[:HEADER_SIZE - len(header)]
+            size += len(data)
+            h.update(data)
+
+        self.check(h, header, size)
+        return header[-IV_SIZE:]
+
+
+class ChunkReader():
+    """ Read only file like object on top of an iterator that yields bytes """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b''
+        self._pos = 0
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self._pos >= len(self._buf):
+                self._buf = next(self._chunks, None)
+                self._pos = 0
+                if self._buf is None:
+                    self._buf = b''
+                    break
+
+            # keep an offset into the current chunk so it isn't copied on every read
+            end = len(self._buf) if size < 0 else self._pos + size
+            part = self._buf[self._pos:end]
+            self._pos += len(part)
+            if size > 0:
+                size -= len(part)
+            parts.append(part)
+        return b''.join(parts)
+
+
+class StreamFernet():
+    """ Holds the decoded fernet key so it can be reused for many files """
+    def __init__(self, key):
+        self._signing_key, self._encryption_key = split_key(key)
+
+    def writer(self, fp):
+        """ Return file like object that encrypts into fp """
+        return EncryptWriter(self._signing_key, self._encryption_key, fp)
+
+    def _decryptor(self, iv):
+        decryptor = Cipher(algorithms.AES(self._encryption_key), modes.CBC(iv)).decryptor()
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        return decryptor, unpadder
+
+    def decrypt(self, fp):
+        """ Verify token in seekable file object and yield decrypted chunks.
+            Nothing is yielded before the full token is authenticated.
+            The token is read twice, InvalidToken is raised when the file changes size or mtime in between.
+            A rewrite that keeps both isn't detected, use decrypt_file() when that matters """
+        token = Token(fp)
+        st = os.fstat(fp.fileno())
+        iv = token.verify(self._signing_key)
+        self._check_unchanged(fp, st)
+
+        decryptor, unpadder = self._decryptor(iv)
+
+        skip = HEADER_SIZE
+        for data in token:
+            if skip:
+                data, skip = data[skip:], max(0, skip - len(data))
+            yield unpadder.update(decryptor.update(data))
+
+        self._check_unchanged(fp, st)
+
+        try:
+            yield unpadder.update(decryptor.finalize()) + unpadder.finalize()
+        except ValueError:
+            raise InvalidToken
+
+    def _check_unchanged(self, fp, st):
+        st_now = os.fstat(fp.fileno())
+        if (st.st_size, st.st_mtime_ns) != (st_now.st_size, st_now.st_mtime_ns):
+            raise InvalidToken
+
+    def decrypt_unverified(self, fp):
+        """ Decrypt and authenticate token in file object in a single pass, yield decrypted chunks.
+            The signature can only be checked at the end, so chunks can't be trusted until the
+            generator is exhausted without raising InvalidToken """
+        token = Token(fp)
+        h = HMAC(self._signing_key, hashes.SHA256())
+        header = b''
+        size = 0
+        decryptor = None
+
+        for data in token:
+            h.update(data)
+            size += len(data)
+
+            if decryptor is None:
+                header += data
+                if len(header) < HEADER_SIZE:
+                    continue
+                if header[:1] != FERNET_VERSION:
+                    raise InvalidToken
+                decryptor, unpadder = self._decryptor(header[HEADER_SIZE - IV_SIZE:HEADER_SIZE])
+                data = header[HEADER_SIZE:]
+
+            yield unpadder.update(decryptor.update(data))
+
+        token.check(h, header, size)
+
+        try:
+            yield unpadder.update(decryptor.finalize()) + unpadder.finalize()
+        except ValueError:
+            raise InvalidToken
+
+    def reader(self, fp):
+        """ Return file like object that reads decrypted data from token in seekable file object """
+        return ChunkReader(self.decrypt(fp))
+
+    @contextlib.contextmanager
+    def encrypt_to(self, dest):
+        """ Yield file like object, everything written to it ends up as a fernet token at dest path """
+        try:
+            with open(dest, 'wb') as f_out, self.writer(f_out) as writer:
+                yield writer
+        except BaseException:
+            # don't leave half written tokens behind
+            if os.path.exists(dest):
+                os.unlink(dest)
+            raise
+
+    def encrypt_file(self, src, dest):
+        """ Encrypt file at src path into a fernet token at dest path """
+        with open(src, 'rb') as f_in, self.encrypt_to(dest) as writer:
+            for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b''):
+                writer.write(chunk)
+
+    def decrypt_file(self, src, dest):
+        """ Decrypt fernet token at src path into dest path.
+            Token is read once, decrypted into a tmp file next to dest and only moved into place
+            after it is authenticated, so dest never contains unauthenticated data """
+        fd, tmp = tempfile.mkstemp(prefix='.microdot_', dir=os.path.dirname(os.path.abspath(dest)))
+
+        try:
+            with os.fdopen(fd, 'wb') as f_out, open(src, 'rb') as f_in:
+                for chunk in self.decrypt_unverified(f_in):
+                    f_out.write(chunk)
+            os.replace(tmp, dest)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+@functools.lru_cache(maxsize=None)
+def get_fernet(key):
+    """ Decoding the key and setting up the primitives only has to happen once per key """
+    return StreamFernet(key)
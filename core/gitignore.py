@@ -17,8 +17,11 @@ class Gitignore():
             debug('gitignore', 'list', f"{i}: {line}")
 
     def read(self):
+        # keep order of lines but use a set for membership tests
+        seen = set(self._lines)
         for l in self._path.read_text().split():
-            if l not in self._lines:
+            if l not in seen:
+                seen.add(l)
                 self._lines.append(l)
 
     def write(self):
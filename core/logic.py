@@ -3,7 +3,7 @@ import logging
 import shutil
 
 from core.utils import info, debug
-from core import state
+from core import state, HOME
 from core.channel import DotEncryptedBaseClass
 
 logger = logging.getLogger("microdot")
@@ -13,7 +13,7 @@ class LastSyncIndex():
     """ Keep a list of encrypted filenames that represent the last known state """
 
     def __init__(self):
-        self._path = Path.home() / '.config/microdot/sync_index.db'
+        self._path = HOME / '.config/microdot/sync_index.db'
         self._list = []
 
     def read_list(self):
@@ -61,6 +61,9 @@ class SyncAlgorithm(LastSyncIndex):
         """ Check if items from list don't have corresponding data on system.
             If so, this indicates a deletion """
 
+        # set lookup so we don't loop over all dotfiles for every list entry
+        dotfile_paths = {dotfile.path for dotfile in dotfiles}
+
         for path in [x.strip() for x in self._list]:
             if not path:
                 continue
@@ -75,21 +78,20 @@ class SyncAlgorithm(LastSyncIndex):
             decrypted_path = (state.core.dotfiles_dir / 'decrypted' / Path(path).relative_to(state.core.dotfiles_dir)).parent / name
 
             # see if status list entry has a corresponding file on disk
-            for dotfile in dotfiles:
-                if decrypted_path == dotfile.path:
-                    break
+            if decrypted_path in dotfile_paths:
+                continue
+
+            if decrypted_path.is_file():
+                decrypted_path.unlink()
+                info("check_removed", "deleted_file", decrypted_path)
+            elif decrypted_path.is_dir():
+                shutil.rmtree(decrypted_path, ignore_errors=False, onerror=None)
+                info("check_removed", "deleted_dir", decrypted_path)
             else:
-                if decrypted_path.is_file():
-                    decrypted_path.unlink()
-                    info("check_removed", "deleted_file", decrypted_path)
-                elif decrypted_path.is_dir():
-                    shutil.rmtree(decrypted_path, ignore_errors=False, onerror=None)
-                    info("check_removed", "deleted_dir", decrypted_path)
-                else:
-                    logger.error(f"Dont know what to do with this path: {decrypted_path}")
-
-                self.remove(encrypted_path)
-                debug("check_removed", "rmlist", decrypted_path)
+                logger.error(f"Dont know what to do with this path: {decrypted_path}")
+
+            self.remove(encrypted_path)
+            debug("check_removed", "rmlist", decrypted_path)
 
     def a_is_new(self, a, b):
         if not self.in_list(a) and not self.exists(b):
@@ -8,13 +8,21 @@ import shutil
 from typing import Optional
 from filecmp import dircmp
 
-from core.utils import debug, info, get_hash, get_tar, confirm
+from core.utils import debug, info, get_hash, confirm
 from core.exceptions import MDMergeError
 from core.channel import Conflict, DotBaseClass
 
 logger = logging.getLogger("microdot")
 
 
+def mktemp(prefix, dir=None):
+    """ Create an empty tmp file and return its path.
+        Unlike tempfile.mktemp() the name can't be claimed by someone else before we use it """
+    fd, path = tempfile.mkstemp(prefix=prefix, dir=dir)
+    os.close(fd)
+    return Path(path)
+
+
 @dataclass
 class MergeBaseClass():
     current: Path
@@ -66,10 +74,11 @@ class MergeFile(MergeBaseClass):
 
         """
         # copy current path to a tmp file
-        merge_file = Path(tempfile.mktemp(prefix=f'{self.current.name}'))
+        # keep merged data next to the decrypted conflict, which lives in a private tmp dir
+        merge_file = mktemp(prefix=f'{self.current.name}', dir=self.conflict.parent)
         shutil.copy(self.current, merge_file)
 
-        tmp_empty = Path(tempfile.mktemp(prefix='empty_'))
+        tmp_empty = mktemp(prefix='empty_')
         tmp_empty.write_text('')
 
         cmd = ['git', 'merge-file', '-L', 'current', '-L', 'empty', '-L', 'conflict', str(merge_file.absolute()), str(tmp_empty.absolute()), str(self.conflict.absolute())]
@@ -77,7 +86,7 @@ class MergeFile(MergeBaseClass):
         result = subprocess.run(cmd, capture_output=True)
 
         if result.returncode < 0:
-            cleanup([tmp_empty.unlink(), merge_file.unlink()])
+            cleanup([tmp_empty, merge_file])
             raise MDMergeError(f"Failed to merge: {' '.join(cmd)}\n{result.stdout.decode()}\n{result.stderr.decode()}")
 
         tmp_empty.unlink()
@@ -186,7 +195,7 @@ class MergeDir(MergeBaseClass):
 
     def generate_merge_file(self):
         """ Create a file with all changes that can be parsed and executed later """
-        merge_file = Path(tempfile.mktemp(prefix='dir_merge_'))
+        merge_file = mktemp(prefix='dir_merge_')
         lines = ["# Actions in this file will be executed.",
                  "# If you don't want to execute a line, just delete it.\n#",
                  "#   current  = side that is in use currently.",
@@ -247,9 +256,10 @@ def cleanup(items):
 def handle_file_conflict(df_current: DotBaseClass, conflict: Conflict):
     """ Go through the full process of handling a file conflict """
 
-    # decrypt current and conflict file to tmp files
-    tmp_current  = Path(tempfile.mktemp(prefix=f'current_{df_current.name.name}_'))
-    tmp_conflict = Path(tempfile.mktemp(prefix=f'conflict_{df_current.name.name}_'))
+    # decrypt current and conflict file into a tmp dir that is only accessible by us
+    tmp_dir      = Path(tempfile.mkdtemp(prefix=f'merge_{df_current.name.name}_'))
+    tmp_current  = tmp_dir / f'current_{df_current.name.name}'
+    tmp_conflict = tmp_dir / f'conflict_{df_current.name.name}'
     df_current.decrypt(dest=tmp_current)
     df_current.decrypt_conflict(conflict, tmp_conflict)
 
@@ -258,18 +268,18 @@ def handle_file_conflict(df_current: DotBaseClass, conflict: Conflict):
 
     if not (merge_file := merge.merge(dest=df_current.path, do_confirm=False)):
         info("merge", "merge", "Merge canceled")
-        cleanup([tmp_current, tmp_conflict])
+        cleanup([tmp_dir])
         return
 
     merge.list(merge_file)
 
     if not confirm(f"Would you like to apply changes to: {df_current.name}?", canceled_msg="Merge canceled"):
-        cleanup([tmp_current, tmp_conflict, merge_file])
+        cleanup([tmp_dir])
         return
 
     shutil.move(merge_file, df_current.path)
     df_current.update()
-    cleanup([tmp_current, tmp_conflict])
+    cleanup([tmp_dir])
     return True
 
 def handle_dir_conflict(df_current: DotBaseClass, conflict: Conflict):
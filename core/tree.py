@@ -1,3 +1,4 @@
+import sys
 from dataclasses import dataclass, field
 
 from core.utils import colorize
@@ -80,7 +81,16 @@ class TreeNode():
                 break
             node = node._next
 
-    def display(self, tree_color='magenta') -> None:
+    def display(self, tree_color='magenta', file=None) -> None:
+        """ Write whole tree in one go instead of printing it line by line """
+        lines = self.render(tree_color=tree_color)
+        (file or sys.stdout).write('\n'.join(lines) + '\n')
+
+    def render(self, tree_color='magenta', lines=None) -> list:
+        """ Render node and children into list of lines """
+        if lines is None:
+            lines = []
+
         prefix = self.follow(self._parent)[::-1]
 
         if not self.is_root():
@@ -97,7 +107,8 @@ class TreeNode():
 
         prefix = colorize(prefix, tree_color)
 
-        print(f"{prefix}{self._name}")
+        lines.append(f"{prefix}{self._name}")
 
         for node in self._children:
-            node.display(tree_color=tree_color)
+            node.render(tree_color=tree_color, lines=lines)
+        return lines
@@ -1,13 +1,21 @@
 import sys
+import os
+import errno
+import shutil
+import stat
+import json
+import threading
+import tempfile
+import atexit
 from pathlib import Path
 import inspect
 import time
 import logging
-import tempfile
 import hashlib
 import base64
 import tarfile
 import re
+from operator import attrgetter
 
 import git
 from git import Repo
@@ -19,7 +27,35 @@ CATEGORY_JUST = 5
 ACTION_JUST = 5
 
 # characters to use instead of the filsystem unsafe +/
-BASE_64_ALT_CHARS = "@-"
+BASE_64_ALT_CHARS = b"@-"
+
+COLORS = {}
+COLORS['black']    = '\033[0;30m'
+COLORS['bblack']   = '\033[1;30m'
+COLORS['red']      = '\033[0;31m'
+COLORS['bred']     = '\033[1;31m'
+COLORS['green']    = '\033[0;32m'
+COLORS['bgreen']   = '\033[1;32m'
+COLORS['yellow']   = '\033[0;33m'
+COLORS['byellow']  = '\033[1;33m'
+COLORS['blue']     = '\033[0;34m'
+COLORS['bblue']    = '\033[1;34m'
+COLORS['magenta']  = '\033[0;35m'
+COLORS['bmagenta'] = '\033[1;35m'
+COLORS['cyan']     = '\033[0;36m'
+COLORS['bcyan']    = '\033[1;36m'
+COLORS['white']    = '\033[0;37m'
+COLORS['bwhite']   = '\033[1;37m'
+COLORS['reset']    = '\033[0m'
+COLORS['default']    = '\033[0m'
+
+# persistent cache for get_hash()
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_CACHE_PATH = Path.home() / '.config/microdot/hash_cache.json'
+
+# don't cache hashes of data changed this recently, covers filesystems with 2s timestamps (FAT)
+HASH_CACHE_RACY_NS = 2 * 10**9
+
 
 class Lock():
     """ Does lock things """
@@ -65,27 +101,72 @@ class Lock():
         self.do_lock()
 
 
+class HashCache():
+    """ Remember hashes of files/dirs together with a cheap stat based signature.
+        As long as the signature doesn't change, data doesn't need to be read and hashed again. """
+    def __init__(self, path):
+        self._path = Path(path)
+        self._cache = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            cache = json.loads(self._path.read_text())
+        except (FileNotFoundError, ValueError):
+            cache = {}
+
+        # anything else than a dict was not written by us
+        if not isinstance(cache, dict):
+            cache = {}
+
+        # forget about paths that don't exist anymore
+        self._cache = {k: v for k, v in cache.items() if os.path.exists(k)}
+
+    def write(self):
+        """ Write to tmp file and replace, a concurrent run never reads a half written cache """
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.hash_cache_', dir=self._path.parent)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._cache, f)
+            os.replace(tmp, self._path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def flush(self):
+        """ Write cache if anything was added since last write """
+        with self._lock:
+            if self._dirty:
+                self.write()
+                self._dirty = False
+
+    def get(self, path, signature):
+        with self._lock:
+            if self._cache is None:
+                self.load()
+            entry = self._cache.get(path)
+
+        if entry and entry[0] == signature:
+            return entry[1]
+
+    def set(self, path, signature, digest):
+        with self._lock:
+            if self._cache is None:
+                self.load()
+            self._cache[path] = [signature, digest]
+            self._dirty = True
+
+
+hash_cache = HashCache(HASH_CACHE_PATH)
+
+# long running callers like sync flush after every cycle, this catches everything else
+atexit.register(hash_cache.flush)
+
+
 def colorize(string: str, color: str) -> str:
-    colors = {}
-    colors['black']    = '\033[0;30m'
-    colors['bblack']   = '\033[1;30m'
-    colors['red']      = '\033[0;31m'
-    colors['bred']     = '\033[1;31m'
-    colors['green']    = '\033[0;32m'
-    colors['bgreen']   = '\033[1;32m'
-    colors['yellow']   = '\033[0;33m'
-    colors['byellow']  = '\033[1;33m'
-    colors['blue']     = '\033[0;34m'
-    colors['bblue']    = '\033[1;34m'
-    colors['magenta']  = '\033[0;35m'
-    colors['bmagenta'] = '\033[1;35m'
-    colors['cyan']     = '\033[0;36m'
-    colors['bcyan']    = '\033[1;36m'
-    colors['white']    = '\033[0;37m'
-    colors['bwhite']   = '\033[1;37m'
-    colors['reset']    = '\033[0m'
-    colors['default']    = '\033[0m'
-    return colors[color] + str(string) + colors["reset"]
+    return COLORS[color] + str(string) + COLORS["reset"]
 
 def confirm(msg, assume_yes: bool=False, canceled_msg=None):
     """ Let user confirm, display canceled_msg on deny """
@@ -114,29 +195,91 @@ def die(msg, code=1):
     logger.error(msg)
     sys.exit(code)
 
-def get_tar(src):
-    """ Compress path into tar archive and save in tmp file """
-    tmp_file = Path(tempfile.mktemp())
+def is_subpath(child, parent) -> bool:
+    """ Lexical check if child is parent or inside parent, same result as a successful Path.relative_to()
+        but without raising and catching an exception on every miss """
+    child, parent = os.fspath(child), os.fspath(parent)
+    return child == parent or child.startswith(parent.rstrip(os.sep) + os.sep)
 
-    with tarfile.open(tmp_file, 'w') as f:
+def move(src, dest):
+    """ Rename src to dest, only fall back to copying when dest is on another filesystem.
+        Unlike shutil.move, dest is never treated as a dir to move src into """
+    try:
+        os.rename(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dest)
+
+def write_tar(src, fp, compression=''):
+    """ Write path as tar archive to file object.
+        Stream mode only writes sequentially so fp doesn't need to be seekable.
+        compression can be any of tarfile's stream compressions: gz, bz2, xz """
+    with tarfile.open(fileobj=fp, mode=f'w|{compression}') as f:
         f.add(src, arcname=src.name)
-    return tmp_file
-
-def get_rec_hash(path, md5):
-    """ Do some recursive path seeking """
-    md5.update(path.name.encode())
-    if path.is_dir():
-        for i in sorted(path.iterdir(), key=lambda x: x.name):
-            get_rec_hash(i, md5)
+
+def get_rec_hash(path, md5, name=None):
+    """ Do some recursive path seeking.
+        Works on plain string paths and DirEntry objects so no Path objects are created per file """
+    md5.update((name or os.path.basename(path)).encode())
+    if os.path.isdir(path):
+        with os.scandir(path) as it:
+            entries = sorted(it, key=attrgetter('name'))
+        for e in entries:
+            if e.is_dir():
+                get_rec_hash(e.path, md5, e.name)
+            else:
+                md5.update(e.name.encode())
+                hash_file(e.path, md5)
     else:
-        md5.update(path.read_bytes())
+        hash_file(path, md5)
+
+def hash_file(path, md5):
+    """ Stream file in chunks so big files are never fully loaded in memory """
+    with open(path, 'rb') as f:
+        # file_digest (python >= 3.11) reads into a reusable buffer, feed it our running md5 object
+        if hasattr(hashlib, 'file_digest'):
+            hashlib.file_digest(f, lambda: md5)
+            return
+
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            md5.update(chunk)
+
+def get_signature(path):
+    """ Get signature of file/dir from stat info, changes when path or anything in it changes.
+        ctime and inode are included because tar extraction and copies can restore an old mtime.
+        Returns signature and newest mtime/ctime found """
+    st = os.stat(path)
+    items = [('.', st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)]
+
+    if stat.S_ISDIR(st.st_mode):
+        for root, dirs, files in os.walk(path, followlinks=True):
+            for name in dirs + files:
+                p = os.path.join(root, name)
+                st = os.stat(p)
+                items.append((os.path.relpath(p, path), st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino))
+
+    newest = max(max(i[1], i[2]) for i in items)
+    return hashlib.md5(repr(sorted(items)).encode()).hexdigest(), newest
 
 def get_hash(path, n=8):
     """ Get hash of file name and contents """
-    md5 = hashlib.md5()
-    md5.update(path.name.encode())
-    get_rec_hash(path, md5)
-    return base64.b64encode(md5.digest(), altchars=BASE_64_ALT_CHARS.encode()).decode()[:n]
+    key = os.path.abspath(path)
+    signature, newest = get_signature(path)
+
+    if (digest := hash_cache.get(key, signature)) is None:
+        started = time.time_ns()
+        md5 = hashlib.md5()
+        md5.update(path.name.encode())
+        get_rec_hash(path, md5)
+        digest = base64.b64encode(md5.digest(), altchars=BASE_64_ALT_CHARS).decode()
+
+        # "racy clean", like git: with coarse timestamps a same size change right after hashing
+        # keeps the signature, so only remember hashes of data that was old enough when hashed
+        if started - newest > HASH_CACHE_RACY_NS:
+            hash_cache.set(key, signature, digest)
+
+    return digest[:n]
 
 def get_git_remote(path: Path) -> str:
     try:
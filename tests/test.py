@@ -1,21 +1,27 @@
 #!/usr/bin/env python3
 
 import sys
+import os
 import unittest
 import logging
 import tempfile
 from pathlib import Path
 import shutil
+import io
+import datetime
 
 sys.path.append('../microdot')
 
-from core.channel import get_channel
-from core import state
-from core.utils import info
+from core.channel import get_channel, parse_timestamp
+from core import state, TIMESTAMP_FORMAT
+from core.utils import info, get_hash, get_signature, is_subpath, HashCache, hash_cache
 from core.exceptions import MicrodotError, MDConflictError, MDLinkError, MDEncryptionError
 from core.exceptions import MDDotNotFoundError, MDChannelNotFoundError, MDPathNotFoundError
 from core.exceptions import MDPathLocationError, MDPathExistsError
 from core.sync import Sync
+from core.crypt import StreamFernet, ChunkReader, CHUNK_SIZE
+
+from cryptography.fernet import Fernet, InvalidToken
 
 logger = logging.getLogger("microdot")
 
@@ -217,6 +223,73 @@ class TestLinkUnlink(TestBase):
         self.assertTrue(self.testfile2.resolve() == df_f2.path)
 
 
+    def test_link_all_unlink_all(self):
+        # action do init
+        df_d1 = state.channel.init(self.testdir1, encrypted=True)
+        df_f1 = state.channel.init(self.testfile1, encrypted=True)
+        df_f2 = state.channel.init(self.testfile2, encrypted=False)
+
+        state.channel.unlink_all()
+
+        # assert unlinked state
+        self.assertFalse(self.testdir1.is_symlink())
+        self.assertFalse(self.testfile1.is_symlink())
+        self.assertFalse(self.testfile2.is_symlink())
+        self.assertFalse(df_d1.path.exists())
+        self.assertFalse(df_f1.path.exists())
+
+        state.channel.link_all()
+
+        # assert linked state and decrypted data
+        self.assertTrue(self.testdir1.resolve() == df_d1.path)
+        self.assertTrue(self.testfile1.resolve() == df_f1.path)
+        self.assertTrue(self.testfile2.resolve() == df_f2.path)
+        self.assertTrue((self.testdir1 / 'subdir/file1.txt').read_text() == "bevers")
+        self.assertTrue(self.testfile1.read_text() == "bevers zijn awesome")
+
+    def test_link_all_without_decrypted_dir(self):
+        # encrypted dotfiles in a shared parent are decrypted in parallel, like on a fresh clone
+        parent = self.create_dir(Path.home() / '.config/testdir3')
+        self.addCleanup(self.cleanup, parent)
+
+        paths = []
+        for i in range(8):
+            p = parent / f'file{i}.txt'
+            p.write_text(f"bever {i}")
+            paths.append(p)
+
+        for p in paths:
+            state.channel.init(p, encrypted=True)
+        state.channel.unlink_all()
+
+        shutil.rmtree(Path(state.core.dotfiles_dir) / 'decrypted')
+        state.channel = get_channel('common', state)
+        state.channel.link_all()
+
+        for i, p in enumerate(paths):
+            self.assertTrue(p.is_symlink())
+            self.assertTrue(p.read_text() == f"bever {i}")
+
+    def test_link_existing_path(self):
+        df_f2 = state.channel.init(self.testfile2, encrypted=False)
+        df_f2.unlink()
+
+        # path at link location is only overwritten when forced
+        self.testfile2.write_text("in the way")
+        with self.assertRaises(MDLinkError):
+            df_f2.link()
+        self.assertFalse(self.testfile2.is_symlink())
+
+        df_f2.link(force=True)
+        self.assertTrue(self.testfile2.resolve() == df_f2.path)
+
+        # stale link is replaced
+        df_f2.unlink()
+        self.testfile2.symlink_to(self.testfile2.parent / 'nonexisting')
+        df_f2.link()
+        self.assertTrue(self.testfile2.resolve() == df_f2.path)
+
+
 class TestShitInput(TestBase):
     def test_impossible_input(self):
         df = state.channel.init(self.testfile1, encrypted=False)
@@ -238,6 +311,9 @@ class TestShitInput(TestBase):
         with self.assertRaises(MDPathNotFoundError):
             state.channel.init(l, encrypted=False)
 
+        # link should be left alone
+        self.assertTrue(l.is_symlink())
+
     def test_init_sanity_check(self):
         p = Path('/tmp/testfile.txt')
         p.write_text('test')
@@ -265,6 +341,16 @@ class TestShitInput(TestBase):
             with self.assertRaises(MDChannelNotFoundError):
                 get_channel("non_existing_channel", state)
 
+        with self.subTest("Get channel outside dotfiles dir"):
+            # '..' is a dir but not a channel
+            with self.assertRaises(MDChannelNotFoundError):
+                get_channel("..", state)
+            with self.assertRaises(MDChannelNotFoundError):
+                get_channel("..", state, create=True, assume_yes=True)
+            with self.assertRaises(MDChannelNotFoundError):
+                get_channel("common/subdir", state, create=True, assume_yes=True)
+            self.assertFalse((state.core.dotfiles_dir / 'common/subdir').exists())
+
         with self.subTest("Get non existing dotfile"):
             # try to get non existing dotfile
             with self.assertRaises(MDDotNotFoundError):
@@ -364,6 +450,185 @@ class TestEncryptDecrypt(TestBase):
         self.assertTrue(ddf.name == df.name)
         self.assertTrue(ddf.name == edf.name)
 
+    def test_compressed_dir(self):
+        # assume
+        state.encryption.compression = 'gz'
+        self.addCleanup(setattr, state.encryption, 'compression', '')
+
+        # action
+        df = state.channel.init(self.testdir1, encrypted=True)
+        df.unlink()
+        df.link()
+
+        # assert
+        self.assertTrue((self.testdir1 / 'subdir' / 'file1.txt').read_text() == "bevers")
+
+    def test_invalid_compression(self):
+        # assume
+        state.encryption.compression = 'zstd'
+        self.addCleanup(setattr, state.encryption, 'compression', '')
+
+        # assert, source is left alone
+        with self.assertRaises(MDEncryptionError):
+            state.channel.init(self.testdir1, encrypted=True)
+        self.assertTrue((self.testdir1 / 'subdir' / 'file1.txt').read_text() == "bevers")
+
+
+class TestCrypt(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='crypt_'))
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_stream_fernet_compatible(self):
+        # assume
+        src = self.tmp_dir / 'plain'
+        token = self.tmp_dir / 'token'
+        dest = self.tmp_dir / 'decrypted'
+        content = b"bevers" * CHUNK_SIZE
+
+        src.write_bytes(content)
+        fernet = Fernet(state.encryption.key)
+
+        # streamed token can be decrypted by fernet
+        StreamFernet(state.encryption.key).encrypt_file(src, token)
+        self.assertTrue(fernet.decrypt(token.read_bytes()) == content)
+
+        # fernet token can be decrypted by stream
+        token.write_bytes(fernet.encrypt(content))
+        StreamFernet(state.encryption.key).decrypt_file(token, dest)
+        self.assertTrue(dest.read_bytes() == content)
+
+    def test_stream_invalid_token(self):
+        # assume
+        token = self.tmp_dir / 'token'
+        dest = self.tmp_dir / 'decrypted'
+
+        token.write_bytes(Fernet(Fernet.generate_key()).encrypt(b"bevers"))
+
+        # wrong key should fail and not create dest
+        with self.assertRaises(InvalidToken):
+            StreamFernet(state.encryption.key).decrypt_file(token, dest)
+        self.assertFalse(dest.exists())
+
+    def test_stream_tampered_token(self):
+        # assume
+        token = self.tmp_dir / 'token'
+        dest = self.tmp_dir / 'decrypted'
+
+        token.write_bytes(Fernet(state.encryption.key).encrypt(b"bevers" * CHUNK_SIZE))
+        data = bytearray(token.read_bytes())
+        data[len(data) // 2] = ord('A') if data[len(data) // 2] != ord('A') else ord('B')
+        token.write_bytes(bytes(data))
+        dest.write_text("old data")
+
+        # tampered token should fail and leave dest and dir untouched
+        with self.assertRaises(InvalidToken):
+            StreamFernet(state.encryption.key).decrypt_file(token, dest)
+        self.assertTrue(dest.read_text() == "old data")
+        self.assertTrue(sorted(p.name for p in self.tmp_dir.iterdir()) == ['decrypted', 'token'])
+
+    def test_chunk_reader(self):
+        # assume
+        reader = ChunkReader([b'bev', b'', b'ers', b' zijn awesome'])
+
+        # assert
+        self.assertTrue(reader.read(2) == b'be')
+        self.assertTrue(reader.read(5) == b'vers ')
+        self.assertTrue(reader.read() == b'zijn awesome')
+        self.assertTrue(reader.read(1) == b'')
+
+
+class TestHash(TestBase):
+    def test_hash_changes_with_content(self):
+        # assume
+        hash_file = get_hash(self.testfile1)
+        hash_dir = get_hash(self.testdir1)
+
+        # cached result should be the same
+        self.assertTrue(get_hash(self.testfile1) == hash_file)
+        self.assertTrue(get_hash(self.testdir1) == hash_dir)
+
+        # action, change content but keep size
+        self.testfile1.write_text("BEVERS zijn awesome")
+        (self.testdir1 / 'subdir' / 'file1.txt').write_text("BEVERS")
+
+        # assert
+        self.assertFalse(get_hash(self.testfile1) == hash_file)
+        self.assertFalse(get_hash(self.testdir1) == hash_dir)
+
+    def test_hash_cache_flush(self):
+        # assume
+        tmp_dir = Path(tempfile.mkdtemp(prefix='hash_cache_'))
+        self.addCleanup(self.cleanup, tmp_dir)
+        cache = HashCache(tmp_dir / 'hash_cache.json')
+
+        # action, set only marks cache dirty
+        cache.set(str(self.testfile1), 'signature', 'digest')
+        self.assertFalse((tmp_dir / 'hash_cache.json').exists())
+        cache.flush()
+
+        # assert, no tmp files are left behind and cache can be loaded
+        self.assertTrue([p.name for p in tmp_dir.iterdir()] == ['hash_cache.json'])
+        self.assertTrue(HashCache(tmp_dir / 'hash_cache.json').get(str(self.testfile1), 'signature') == 'digest')
+
+        # cache file with unexpected content is ignored
+        (tmp_dir / 'hash_cache.json').write_text('["bevers"]')
+        self.assertTrue(HashCache(tmp_dir / 'hash_cache.json').get(str(self.testfile1), 'signature') is None)
+
+    def test_hash_cache_racy(self):
+        # action, hash a file that was just written
+        digest = get_hash(self.testfile1)
+        signature, newest = get_signature(self.testfile1)
+
+        # assert, hash is not remembered because a change within the same timestamp could go unnoticed
+        self.assertTrue(hash_cache.get(os.path.abspath(self.testfile1), signature) is None)
+        self.assertTrue(get_hash(self.testfile1) == digest)
+
+
+class TestTimestamp(unittest.TestCase):
+    def test_parse_timestamp(self):
+        # assert, same result as strptime
+        ts = "20220121162145"
+        self.assertTrue(parse_timestamp(ts) == datetime.datetime.strptime(ts, TIMESTAMP_FORMAT))
+
+        for ts in ["2022012116214", "2022012116214x", "+2022012116214", "20221321162145"]:
+            with self.assertRaises(ValueError):
+                parse_timestamp(ts)
+
+
+class TestPaths(unittest.TestCase):
+    def test_is_subpath(self):
+        # assert, same result as Path.relative_to()
+        home = Path.home()
+        for child, parent in [(home / '.config/nvim', home / '.config'),
+                              (home / '.config', home / '.config'),
+                              (home / '.configx', home / '.config'),
+                              (home / '.config', home / '.config/nvim'),
+                              (home, Path('/'))]:
+            try:
+                child.relative_to(parent)
+                expected = True
+            except ValueError:
+                expected = False
+            self.assertTrue(is_subpath(child, parent) == expected)
+
+
+class TestTree(TestBase):
+    def test_display(self):
+        # assume
+        state.channel.init(self.testfile1, encrypted=False)
+        state.channel.init(self.testdir1, encrypted=True)
+        buf = io.StringIO()
+
+        # action
+        state.channel.list(display=False).display(file=buf)
+
+        # assert, one line per node, written at once
+        lines = buf.getvalue().split('\n')
+        self.assertTrue(len(lines) == 5)
+        self.assertTrue("dotfile1.txt" in lines[2])
+        self.assertTrue("testdir1/" in lines[3])
+
 
 class TestInit(TestBase):
     def test_init_update_encrypted_file(self):
@@ -394,6 +659,22 @@ class TestInit(TestBase):
         self.assertTrue(self.testfile1.resolve() == df.path)
 
 
+    def test_get_initiated_dotfile(self):
+        # action
+        df = state.channel.init(self.testfile1, encrypted=False)
+
+        # assert, dotfile is available without reloading channel
+        self.assertTrue(state.channel.get_dotfile(df.name) == df)
+        self.assertTrue(state.channel.dotfile_exists(str(df.name)))
+
+        # only encrypted dotfiles can be found as encrypted
+        edf = state.channel.init(self.testfile2, encrypted=True)
+        self.assertTrue(state.channel.get_encrypted_dotfile(edf.name) == edf)
+
+        with self.assertRaises(MDDotNotFoundError):
+            state.channel.get_encrypted_dotfile(df.name)
+
+
 class TestLink(TestBase):
     def test_init_in_linked_parent(self):
         dir1 = Path.home() / 'testlink_tmp'